@@ -1,9 +1,20 @@
+import hashlib
+import heapq
+import html
 import os
+import re
+from urllib.parse import unquote
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import streamlit as st
 from datetime import datetime, timezone
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
 import json
+import orjson
 
 # Load environment variables (for local development)
 load_dotenv()
@@ -16,137 +27,429 @@ except (KeyError, FileNotFoundError):
     # Fallback to environment variables for local development
     API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 
+# (connect, read) timeouts so a stalled backend can't hang the session
+API_TIMEOUT = (3.0, 15.0)
+UPLOAD_TIMEOUT = (3.0, 60.0)
+AI_TIMEOUT = (3.0, 60.0)
+
+# Request bodies are serialized with orjson, so the content type is set explicitly
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Shared HTTP session - keeps connections to the API alive across calls and reruns
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    # Only idempotent calls are retried on gateway errors; POSTs create tickets/replies.
+    # Read errors are not retried, so a stalled backend surfaces as ReadTimeout
+    # after one read timeout instead of a ConnectionError after four
+    retries = Retry(
+        total=3,
+        read=False,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "PATCH"])
+    )
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept": "application/json", "User-Agent": "ticket-ui/1.0"})
+    return session
+
+SESSION = get_session()
+
 # Test API connection
 def test_api_connection():
     try:
-        response = requests.get(f"{API_BASE_URL}/health", timeout=10)
+        response = SESSION.get(f"{API_BASE_URL}/health", timeout=API_TIMEOUT)
         return response.status_code == 200
-    except:
+    except requests.exceptions.RequestException:
         return False
 
+# The base URL is fixed for the process, so the health check only needs
+# repeating every minute rather than on every rerun
+@st.cache_resource(ttl=60)
+def cached_api_ok():
+    return test_api_connection()
+
 # API Helper functions
-def get_all_tickets():
+def _raise_for_status(response):
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+
+def _fetch_all_tickets_raw(**filters):
+    url = f"{API_BASE_URL}/tickets".rstrip('/')
+    # Ask for replies inline so pages don't need one replies call per ticket
+    response = SESSION.get(url, params={"include": "replies", **filters}, timeout=API_TIMEOUT)
+    _raise_for_status(response)
+    return orjson.loads(response.content)
+
+# Read helpers are cached briefly so widget-driven reruns don't refetch;
+# every mutating helper calls _invalidate_ticket_cache() on success.
+# The cached functions raise on failure so errors are never memoized (or
+# replayed from the cache); the public wrappers report them and return a default
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_all_tickets():
+    return _fetch_all_tickets_raw()
+
+# Title, description and ID lowercased once into a single searchable string
+def _search_haystack(ticket):
+    return f"{ticket.get('title', '')}\0{ticket.get('description', '')}\0{ticket.get('id', '')}".lower()
+
+# (ticket, haystack) pairs built once per ticket-list fetch, so each search
+# is a single substring test per ticket with no lowercasing or refetching
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_tickets_indexed():
+    return [(t, _search_haystack(t)) for t in _cached_all_tickets()]
+
+def _search_indexed(q):
+    needle = q.lower()
+    return [t for t, haystack in _cached_tickets_indexed() if needle in haystack]
+
+# Filtered lookups are pushed to the API; the client-side check keeps the
+# results correct if the backend ignores a filter parameter
+@st.cache_data(ttl=15, show_spinner=False)
+def _cached_tickets_by_user(name):
+    needle = name.lower()
+    return [t for t in _fetch_all_tickets_raw(created_by=name) if needle in t.get('created_by', '').lower()]
+
+def _tickets_or_report(fetch, *args):
     try:
-        url = f"{API_BASE_URL}/tickets".rstrip('/')
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to fetch tickets: {response.status_code}")
-            return []
+        return fetch(*args)
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+    except requests.exceptions.HTTPError as e:
+        st.error(f"Failed to fetch tickets: {e.response.status_code}")
     except Exception as e:
         st.error(f"Error connecting to API: {e}")
-        return []
+    return []
+
+def get_all_tickets():
+    return _tickets_or_report(_cached_all_tickets)
+
+def search_tickets(q):
+    return _tickets_or_report(_search_indexed, q)
+
+def get_tickets_by_user(name):
+    return _tickets_or_report(_cached_tickets_by_user, name)
 
 def create_ticket(ticket_data):
     try:
         # Remove trailing slash from the URL
         url = f"{API_BASE_URL}/tickets".rstrip('/')
-        response = requests.post(url, json=ticket_data)
+        response = SESSION.post(url, data=orjson.dumps(ticket_data), headers=JSON_HEADERS, timeout=API_TIMEOUT)
         if response.status_code in [200, 201]:
-            return response.json()
+            _invalidate_ticket_cache()
+            return orjson.loads(response.content)
         else:
             st.error(f"Failed to create ticket: {response.status_code}")
             st.error(f"Response: {response.text}")
             return None
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return None
     except Exception as e:
         st.error(f"Error creating ticket: {e}")
         return None
 
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_ticket_by_id(ticket_id):
+    url = f"{API_BASE_URL}/tickets/{ticket_id}".rstrip('/')
+    response = SESSION.get(url, timeout=API_TIMEOUT)
+    _raise_for_status(response)
+    return orjson.loads(response.content)
+
 def get_ticket_by_id(ticket_id):
     try:
-        url = f"{API_BASE_URL}/tickets/{ticket_id}".rstrip('/')
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to fetch ticket: {response.status_code}")
-            return None
+        return _cached_ticket_by_id(ticket_id)
+    except requests.exceptions.HTTPError as e:
+        # 404 is an ordinary "not found" - callers report that themselves
+        if e.response.status_code != 404:
+            st.error(f"Failed to fetch ticket: {e.response.status_code}")
+        return None
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return None
     except Exception as e:
         st.error(f"Error fetching ticket: {e}")
         return None
 
-def upload_file_via_api(file_content, filename, ticket_id):
+# The *_raw write helpers only talk to the API and raise on failure, so they
+# are safe to run on worker threads; the *_or_report helpers render errors and
+# invalidate caches, and must run on the script thread (pass future.result)
+def _upload_file_raw(file_obj, filename, ticket_id):
+    # Stream the multipart body from the file object instead of buffering a copy
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    content_type = getattr(file_obj, 'type', None) or "application/octet-stream"
+    encoder = MultipartEncoder(fields={"file": (filename, file_obj, content_type)})
+    url = f"{API_BASE_URL}/tickets/{ticket_id}/attachment".rstrip('/')
+    response = SESSION.post(url, data=encoder, headers={"Content-Type": encoder.content_type}, timeout=UPLOAD_TIMEOUT)
+    _raise_for_status(response)
+    response_data = orjson.loads(response.content)
+    # Return the signed URL for accessing the file
+    return response_data.get("signed_url") or response_data.get("attachment_url")
+
+def _upload_or_report(upload, *args):
     try:
-        files = {"file": (filename, file_content)}
-        url = f"{API_BASE_URL}/tickets/{ticket_id}/attachment".rstrip('/')
-        response = requests.post(url, files=files)
-        if response.status_code == 200:
-            response_data = response.json()
-            # Return the signed URL for accessing the file
-            return response_data.get("signed_url") or response_data.get("attachment_url")
-        else:
-            st.error(f"Failed to upload file: {response.status_code}")
-            return None
+        signed_url = upload(*args)
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return None
+    except requests.exceptions.HTTPError as e:
+        st.error(f"Failed to upload file: {e.response.status_code}")
+        return None
     except Exception as e:
         st.error(f"Error uploading file: {e}")
         return None
+    _invalidate_ticket_cache()
+    return signed_url
 
-def generate_ai_reply(ticket_id, message, image_base64=None, image_filename=None):
+def upload_file_via_api(file_obj, filename, ticket_id):
+    return _upload_or_report(_upload_file_raw, file_obj, filename, ticket_id)
+
+def _generate_ai_reply_raw(ticket_id, message, image_base64=None, image_filename=None):
+    payload = {
+        "ticket_id": ticket_id,
+        "message": message
+    }
+    if image_base64:
+        payload["image_base64"] = image_base64
+        payload["image_filename"] = image_filename
+
+    url = f"{API_BASE_URL}/ai/reply".rstrip('/')
+    response = SESSION.post(url, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=AI_TIMEOUT)
+    _raise_for_status(response)
+    return orjson.loads(response.content)
+
+def _ai_reply_or_report(generate, *args):
     try:
-        payload = {
-            "ticket_id": ticket_id,
-            "message": message
-        }
-        if image_base64:
-            payload["image_base64"] = image_base64
-            payload["image_filename"] = image_filename
-            
-        url = f"{API_BASE_URL}/ai/reply".rstrip('/')
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Failed to generate AI reply: {response.status_code}")
-            return None
+        ai_response = generate(*args)
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return None
+    except requests.exceptions.HTTPError as e:
+        st.error(f"Failed to generate AI reply: {e.response.status_code}")
+        return None
     except Exception as e:
         st.error(f"Error generating AI reply: {e}")
         return None
+    # The API posts the generated reply to the ticket conversation
+    _invalidate_ticket_cache()
+    return ai_response
 
-def send_email_via_api(ticket_id, email_data):
+def generate_ai_reply(ticket_id, message, image_base64=None, image_filename=None):
+    return _ai_reply_or_report(_generate_ai_reply_raw, ticket_id, message, image_base64, image_filename)
+
+# AI replies keyed by ticket and a hash of the conversation they answer, so
+# repeated Generate clicks on an unchanged conversation don't rerun the model.
+# The prompt itself is excluded from the cache key (leading underscore)
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_ai_reply(ticket_id, ctx_hash, _prompt):
+    ai_response = generate_ai_reply(ticket_id, _prompt)
+    if not ai_response:
+        # Raising keeps failures (including empty 200 bodies, which the caller
+        # also treats as failures) out of the cache so the admin can retry
+        raise RuntimeError("AI reply generation failed")
+    return ai_response
+
+def _send_email_raw(ticket_id, email_data):
+    url = f"{API_BASE_URL}/tickets/{ticket_id}/email".rstrip('/')
+    response = SESSION.post(url, data=orjson.dumps(email_data), headers=JSON_HEADERS, timeout=API_TIMEOUT)
+    return response.status_code == 200
+
+def _email_or_report(send, *args):
     try:
-        url = f"{API_BASE_URL}/tickets/{ticket_id}/email".rstrip('/')
-        response = requests.post(url, json=email_data)
-        return response.status_code == 200
+        return send(*args)
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return False
     except Exception as e:
         st.error(f"Error sending email: {e}")
         return False
 
+def send_email_via_api(ticket_id, email_data):
+    return _email_or_report(_send_email_raw, ticket_id, email_data)
+
 def add_reply_via_api(ticket_id, reply_data):
     try:
         url = f"{API_BASE_URL}/tickets/{ticket_id}/replies".rstrip('/')
-        response = requests.post(url, json=reply_data)
+        response = SESSION.post(url, data=orjson.dumps(reply_data), headers=JSON_HEADERS, timeout=API_TIMEOUT)
         if response.status_code == 200:
-            return response.json()
+            _invalidate_ticket_cache()
+            return orjson.loads(response.content)
         else:
             st.error(f"Failed to add reply: {response.status_code}")
             return None
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return None
     except Exception as e:
         st.error(f"Error adding reply: {e}")
         return None
 
-def get_ticket_replies(ticket_id):
+def _fetch_ticket_replies_raw(ticket_id):
+    url = f"{API_BASE_URL}/tickets/{ticket_id}/replies".rstrip('/')
+    response = SESSION.get(url, timeout=API_TIMEOUT)
+    _raise_for_status(response)
+    ticket_data = orjson.loads(response.content)
+    return ticket_data.get('replies', [])
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_ticket_replies(ticket_id):
+    return _fetch_ticket_replies_raw(ticket_id)
+
+def _replies_or_report(fetch, *args):
     try:
-        url = f"{API_BASE_URL}/tickets/{ticket_id}/replies".rstrip('/')
-        response = requests.get(url)
-        if response.status_code == 200:
-            ticket_data = response.json()
-            return ticket_data.get('replies', [])
-        else:
-            return []
+        return fetch(*args)
+    except requests.exceptions.HTTPError:
+        # A non-200 replies lookup just shows an empty conversation, as before
+        return []
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return []
     except Exception as e:
         st.error(f"Error fetching replies: {e}")
         return []
 
+def get_ticket_replies(ticket_id):
+    return _replies_or_report(_cached_ticket_replies, ticket_id)
+
+# Process-wide record of whether the backend lacks the bulk /replies endpoint,
+# so new ticket ID sets skip the probe until the flag expires
+@st.cache_resource(ttl=600)
+def _bulk_replies_support():
+    return {"unsupported": False}
+
+# Replies for many tickets in one request, grouped client-side by ticket ID.
+# This probes an optional endpoint, so any failure quietly returns None and the
+# caller falls back; that None is cached too, limiting probes to one per TTL
+@st.cache_data(ttl=30, show_spinner=False)
+def get_replies_bulk(ticket_ids):
+    support = _bulk_replies_support()
+    if support["unsupported"]:
+        return None
+    try:
+        url = f"{API_BASE_URL}/replies".rstrip('/')
+        params = {"ticket_ids": ",".join(str(ticket_id) for ticket_id in ticket_ids)}
+        response = SESSION.get(url, params=params, timeout=API_TIMEOUT)
+        if response.status_code in (404, 405, 501):
+            support["unsupported"] = True
+            return None
+        if response.status_code != 200:
+            return None
+        data = orjson.loads(response.content)
+        replies = data.get('replies') if isinstance(data, dict) else data
+    except Exception:
+        return None
+    # Only trust the result if every reply is tagged with one of the requested
+    # tickets; any other shape means this backend has no usable bulk endpoint
+    if not isinstance(replies, list):
+        support["unsupported"] = True
+        return None
+    wanted = set(ticket_ids)
+    grouped = defaultdict(list)
+    for reply in replies:
+        if not isinstance(reply, dict) or reply.get('ticket_id') not in wanted:
+            support["unsupported"] = True
+            return None
+        grouped[reply['ticket_id']].append(reply)
+    return {ticket_id: grouped[ticket_id] for ticket_id in ticket_ids}
+
 def update_ticket_status(ticket_id, status):
     try:
         url = f"{API_BASE_URL}/tickets/{ticket_id}/status".rstrip('/')
-        response = requests.patch(url, json={"status": status})
-        return response.status_code == 200
+        response = SESSION.patch(url, data=orjson.dumps({"status": status}), headers=JSON_HEADERS, timeout=API_TIMEOUT)
+        if response.status_code == 200:
+            _invalidate_ticket_cache()
+            return True
+        return False
+    except requests.exceptions.Timeout:
+        st.error("⏱️ API timed out. Please try again.")
+        return False
     except Exception as e:
         st.error(f"Error updating ticket status: {e}")
         return False
 
+def _invalidate_ticket_cache():
+    _cached_all_tickets.clear()
+    _cached_tickets_indexed.clear()
+    _cached_tickets_by_user.clear()
+    _cached_ticket_by_id.clear()
+    _cached_ticket_replies.clear()
+    get_replies_bulk.clear()
+
+# Replies for a page of tickets: embedded replies are used as-is, the rest come
+# from one bulk request, or from concurrent per-ticket lookups as a last resort.
+# Workers call the cached fetch, which raises instead of calling st.*;
+# errors are reported here on the script thread
+def get_replies_for_tickets(tickets):
+    replies_by_ticket = {t['id']: t['replies'] for t in tickets if t.get('replies') is not None}
+    missing = [t['id'] for t in tickets if t['id'] not in replies_by_ticket]
+    if not missing:
+        return replies_by_ticket
+    bulk = get_replies_bulk(tuple(missing))
+    if bulk is not None:
+        replies_by_ticket.update(bulk)
+    else:
+        with ThreadPoolExecutor(max_workers=min(8, len(missing))) as executor:
+            futures = [executor.submit(_cached_ticket_replies, ticket_id) for ticket_id in missing]
+        for ticket_id, future in zip(missing, futures):
+            replies_by_ticket[ticket_id] = _replies_or_report(future.result)
+    return replies_by_ticket
+
+# Chat bubble (css class, icon, label) per reply role
+ROLE_TEMPLATES = {
+    'user': ('user-message', '👤', 'User'),
+    'ai': ('assistant-message', '🤖', 'AI Assistant'),
+    'admin': ('admin-message', '👨‍💼', 'Admin'),
+}
+
+# Conversation markup, filled with str.format_map; values are HTML-escaped first
+_CHAT_MSG_TMPL = '<div class="chat-message {cls}">{icon} <strong>{label}{time}:</strong><br>{text}</div>'
+_ADMIN_MSG_TMPL = '<div class="chat-message {cls}">{icon} <strong>{label}:</strong> {text}</div>'
+_IMAGE_TMPL = '<figure><img src="{url}" loading="lazy" width="200"><figcaption>📷 {name}</figcaption></figure>'
+_FILE_LINK_TMPL = '<p>📎 <a href="{url}" target="_blank">📥 {name}</a></p>'
+
+# Ticket statuses in selectbox order, with a reverse index for the current value
+_STATUSES = ("Open", "In Progress", "Closed")
+_STATUS_IDX = {status: i for i, status in enumerate(_STATUSES)}
+
+# Sort key for newest-first ticket lists
+def _created_at_key(ticket):
+    return ticket.get('created_at', '')
+
+# Attachment URLs end in storage keys like "api_2025-09-04T14:30:50.602985+00:00_test.txt";
+# the display name starts at the first "_"-separated part with a known file extension
+_EXT_RE = re.compile(r'\.(png|jpe?g|gif|webp|bmp|svg|pdf|txt|docx?|xlsx?)(?=$|_)', re.I)
+IMG_EXTS = frozenset({'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.svg'})
+
+def extract_attachment_filename(url):
+    """Return (file_name, is_image) for an attachment URL."""
+    # Last path segment, ignoring query parameters - index scans, no intermediate lists
+    end = url.find('?')
+    if end == -1:
+        end = len(url)
+    name = url[url.rfind('/', 0, end) + 1:end]
+    if name.count('_') >= 2:
+        match = _EXT_RE.search(name)
+        if match:
+            name = name[name.rfind('_', 0, match.start()) + 1:]
+        else:
+            # If no extension found, take the last part
+            name = name[name.rfind('_') + 1:]
+    name = unquote(name) or "attachment"
+    is_image = os.path.splitext(name)[1].lower() in IMG_EXTS
+    return name, is_image
+
+# Parsed attachment names memoized in session state so reruns skip the parse
+def _attachment_info(url):
+    cache = st.session_state.setdefault('_fname_cache', {})
+    if url not in cache:
+        if len(cache) >= 1024:
+            cache.clear()
+        cache[url] = extract_attachment_filename(url)
+    return cache[url]
+
 # Streamlit App
 def main():
     st.set_page_config(
@@ -158,8 +461,14 @@ def main():
 
     # ...existing code...
 
-    # Check API connection
-    if not test_api_connection():
+    # main() only runs on full reruns, where every page resolves fresh replies,
+    # so replies marked stale by fragment reruns no longer need refetching
+    st.session_state.pop('_updated_tickets', None)
+
+    # Check API connection (cached - the sidebar button forces a fresh check)
+    if st.sidebar.button("🔄 Recheck API"):
+        cached_api_ok.clear()
+    if not cached_api_ok():
         st.error(f"⚠️ Cannot connect to API at {API_BASE_URL}")
         st.info("Please check if the API is running and the URL is correct.")
         return
@@ -194,9 +503,10 @@ def show_dashboard():
     # Statistics
     col1, col2, col3, col4 = st.columns(4)
     
-    open_tickets = len([t for t in tickets if t['status'] == 'Open'])
-    in_progress_tickets = len([t for t in tickets if t['status'] == 'In Progress'])
-    closed_tickets = len([t for t in tickets if t['status'] == 'Closed'])
+    counts = Counter(t['status'] for t in tickets)
+    open_tickets = counts.get('Open', 0)
+    in_progress_tickets = counts.get('In Progress', 0)
+    closed_tickets = counts.get('Closed', 0)
     total_tickets = len(tickets)
     
     with col1:
@@ -228,10 +538,10 @@ def show_dashboard():
             show_ticket_details(selected_ticket)
             return
     
-    # Sort tickets by creation date (newest first)
-    sorted_tickets = sorted(tickets, key=lambda x: x.get('created_at', ''), reverse=True)
+    # Newest 10 tickets by creation date - no need to sort the whole list
+    recent_tickets = heapq.nlargest(10, tickets, key=_created_at_key)
     
-    for ticket in sorted_tickets[:10]:  # Show last 10 tickets
+    for ticket in recent_tickets:  # Show last 10 tickets
         with st.expander(f"🎫 #{ticket['id']} - {ticket['title']}", expanded=False):
             col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
@@ -294,34 +604,40 @@ def create_ticket_page():
                 if ticket_id:
                     st.success(f"✅ Ticket #{ticket_id} created successfully!")
                     
-                    # Handle file uploads after ticket creation
-                    if uploaded_files:
-                        for uploaded_file in uploaded_files:
-                            file_url = upload_file_via_api(uploaded_file.getvalue(), uploaded_file.name, ticket_id)
-                            if file_url:
-                                st.info(f"📎 File '{uploaded_file.name}' uploaded successfully!")
-                    
-                    # Generate AI reply
-                    ai_response = generate_ai_reply(ticket_id, f"New ticket: {title}\n\n{description}")
+                    # Attachments, AI reply and confirmation email only need the
+                    # ticket ID, so they are sent together instead of one after another.
+                    # Workers only call the API; results and errors are shown here
+                    with ThreadPoolExecutor(max_workers=8) as executor:
+                        upload_futures = {
+                            executor.submit(_upload_file_raw, f, f.name, ticket_id): f.name
+                            for f in uploaded_files or []
+                        }
+                        ai_future = executor.submit(_generate_ai_reply_raw, ticket_id, f"New ticket: {title}\n\n{description}")
+                        
+                        # Send email notification if email provided
+                        email_future = None
+                        if email:
+                            email_data = {
+                                "to_email": email,
+                                "subject": f"Ticket #{ticket_id} Created Successfully",
+                                "message": f"Your ticket '{title}' has been created and assigned ID #{ticket_id}. We'll get back to you soon!"
+                            }
+                            email_future = executor.submit(_send_email_raw, ticket_id, email_data)
+                        
+                        for future in as_completed(upload_futures):
+                            if _upload_or_report(future.result):
+                                st.info(f"📎 File '{upload_futures[future]}' uploaded successfully!")
+                        if _ai_reply_or_report(ai_future.result):
+                            st.info("🤖 AI assistant has reviewed your ticket!")
+                        if email_future and _email_or_report(email_future.result):
+                            st.info("📧 Confirmation email sent!")
                 else:
                     st.success("✅ Ticket created successfully!")
                     st.info("Note: Ticket ID not available in response")
                     # Debug: Show the actual response structure
                     st.write("API Response:", new_ticket)
-                if ai_response:
-                    st.info("🤖 AI assistant has reviewed your ticket!")
                 
                 st.balloons()
-                
-                # Send email notification if email provided
-                if email and ticket_id:
-                    email_data = {
-                        "to_email": email,
-                        "subject": f"Ticket #{ticket_id} Created Successfully",
-                        "message": f"Your ticket '{title}' has been created and assigned ID #{ticket_id}. We'll get back to you soon!"
-                    }
-                    if send_email_via_api(ticket_id, email_data):
-                        st.info("📧 Confirmation email sent!")
 
 def my_tickets_page():
     st.title("👤 My Tickets")
@@ -330,8 +646,7 @@ def my_tickets_page():
     user_name = st.text_input("Enter your name to view your tickets:", placeholder="Enter the name you used when creating tickets")
     
     if user_name:
-        tickets = get_all_tickets()
-        my_tickets = [t for t in tickets if user_name.lower() in t.get('created_by', '').lower()]
+        my_tickets = get_tickets_by_user(user_name)
         
         if not my_tickets:
             st.info(f"No tickets found for '{user_name}'")
@@ -339,9 +654,10 @@ def my_tickets_page():
         
         st.success(f"Found {len(my_tickets)} tickets for '{user_name}'")
         
-        for ticket in sorted(my_tickets, key=lambda x: x.get('created_at', ''), reverse=True):
+        replies_by_ticket = get_replies_for_tickets(my_tickets)
+        for ticket in sorted(my_tickets, key=_created_at_key, reverse=True):
             with st.expander(f"🎫 #{ticket['id']} - {ticket['title']} ({ticket['status']})", expanded=False):
-                show_ticket_details(ticket)
+                show_ticket_details(ticket, replies_by_ticket[ticket['id']])
 
 def search_tickets_page():
     st.title("🔍 Search Tickets")
@@ -360,19 +676,14 @@ def search_tickets_page():
         st.info(f"🔍 Searching for: '{search_term}'")
     
     if search_term:
-        tickets = get_all_tickets()
-        
-        # Filter tickets based on search term
-        filtered_tickets = []
-        for ticket in tickets:
-            # If searching by ID, exact match
-            if search_by_id and str(ticket.get('id', '')) == search_term.strip():
-                filtered_tickets.append(ticket)
-            # General search in title, description, or ID
-            elif not search_by_id and (search_term.lower() in ticket.get('title', '').lower() or 
-                search_term.lower() in ticket.get('description', '').lower() or 
-                search_term in str(ticket.get('id', ''))):
-                filtered_tickets.append(ticket)
+        # If searching by ID, look the ticket up directly - only numeric IDs
+        # go into the URL path, anything else can't match a ticket
+        if search_by_id:
+            ticket = get_ticket_by_id(search_term) if search_term.isdigit() else None
+            filtered_tickets = [ticket] if ticket else []
+        # General search in title, description, or ID
+        else:
+            filtered_tickets = search_tickets(search_term)
         
         if not filtered_tickets:
             if search_by_id:
@@ -386,11 +697,12 @@ def search_tickets_page():
         else:
             st.success(f"Found {len(filtered_tickets)} tickets matching '{search_term}'")
         
+        replies_by_ticket = get_replies_for_tickets(filtered_tickets)
         for ticket in filtered_tickets:
             with st.expander(f"🎫 #{ticket['id']} - {ticket['title']}", expanded=True if search_by_id else False):
-                show_ticket_details(ticket)
+                show_ticket_details(ticket, replies_by_ticket[ticket['id']])
 
-def show_ticket_details(ticket):
+def show_ticket_details(ticket, replies=None):
     # Ticket information section
     col1, col2 = st.columns([2, 1])
     
@@ -413,39 +725,10 @@ def show_ticket_details(ticket):
         st.markdown("📎 **Original Ticket Attachment:**")
         attachment_url = ticket['attachment_url']
         
-        # Try to extract filename from URL
-        try:
-            if attachment_url.startswith('http'):
-                # Remove query parameters first (everything after '?')
-                url_without_params = attachment_url.split('?')[0]
-                
-                # Extract the path part after the last '/'
-                path_part = url_without_params.split('/')[-1]
-                
-                # Handle timestamp format like "api_2025-09-04T14:30:50.602985+00:00_test.txt"
-                if '_' in path_part and len(path_part.split('_')) >= 3:
-                    # Find the original filename after the timestamp
-                    parts = path_part.split('_')
-                    # Look for parts that contain file extensions
-                    for i, part in enumerate(parts):
-                        if '.' in part and any(ext in part.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.svg', '.pdf', '.txt', '.doc', '.xlsx']):
-                            file_name = '_'.join(parts[i:])
-                            break
-                    else:
-                        # If no extension found, take the last part
-                        file_name = parts[-1] if parts else "attachment"
-                else:
-                    file_name = path_part
-                
-                # Clean up URL encoding
-                file_name = file_name.replace('%20', ' ').replace('%2B', '+')
-            else:
-                file_name = "attachment"
-        except:
-            file_name = "attachment"
+        file_name, is_image = _attachment_info(attachment_url)
         
         # Display based on file type
-        if any(ext in attachment_url.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.svg']):
+        if is_image:
             try:
                 col1, col2 = st.columns([3, 1])
                 with col1:
@@ -467,8 +750,30 @@ def show_ticket_details(ticket):
                 st.markdown(f"**Type:** Document")
                 st.markdown(f"[🔗 Open Link]({attachment_url})")
     
-    # Show replies/conversation
-    replies = get_ticket_replies(ticket['id'])
+    ticket_conversation(ticket, replies)
+
+# Fragments rerun with the arguments they were first called with, so tickets
+# updated from inside a fragment re-read their replies on fragment reruns.
+# The markers only last until the next full run, which passes fresh replies
+def _mark_ticket_updated(ticket_id):
+    st.session_state.setdefault('_updated_tickets', set()).add(ticket_id)
+
+def _fragment_replies(ticket, replies):
+    if ticket['id'] in st.session_state.get('_updated_tickets', ()):
+        return get_ticket_replies(ticket['id'])
+    return replies
+
+# Conversation and reply form rerun on their own after a reply is sent,
+# without refetching or re-rendering the rest of the page
+@st.fragment
+def ticket_conversation(ticket, replies=None):
+    replies = _fragment_replies(ticket, replies)
+    
+    # Show replies/conversation - prefer replies already embedded in the ticket
+    if replies is None:
+        replies = ticket.get('replies')
+    if replies is None:
+        replies = get_ticket_replies(ticket['id'])
     
     st.markdown("---")
     st.subheader("💬 Conversation History")
@@ -479,9 +784,12 @@ def show_ticket_details(ticket):
         # Sort replies by timestamp if available
         try:
             sorted_replies = sorted(replies, key=lambda x: x.get('created_at', x.get('timestamp', '')))
-        except:
+        except TypeError:
             sorted_replies = replies
-            
+        
+        # Messages are collected and rendered with one st.markdown call; the
+        # batch is only flushed early when an attachment needs its own widgets
+        html_chunks = []
         for i, reply in enumerate(sorted_replies):
             # Handle different field name possibilities
             role = reply.get('role') or reply.get('reply_type', 'user')
@@ -493,61 +801,42 @@ def show_ticket_details(ticket):
             if timestamp:
                 try:
                     time_str = f" • {timestamp[:16]}"
-                except:
+                except TypeError:
                     time_str = ""
             
-            if role == 'user':
-                st.markdown(f'<div class="chat-message user-message">👤 <strong>User{time_str}:</strong><br>{text}</div>', unsafe_allow_html=True)
-            elif role == 'ai':
-                st.markdown(f'<div class="chat-message assistant-message">🤖 <strong>AI Assistant{time_str}:</strong><br>{text}</div>', unsafe_allow_html=True)
-            elif role == 'admin':
-                st.markdown(f'<div class="chat-message admin-message">👨‍💼 <strong>Admin{time_str}:</strong><br>{text}</div>', unsafe_allow_html=True)
+            cls, icon, label = ROLE_TEMPLATES.get(role, ROLE_TEMPLATES['user'])
+            html_chunks.append(_CHAT_MSG_TMPL.format_map({
+                'cls': cls, 'icon': icon, 'label': label,
+                'time': html.escape(time_str), 'text': html.escape(text or '')
+            }))
             
             # Show reply attachments if any
             if reply.get('attachment_url'):
+                if html_chunks:
+                    st.markdown("".join(html_chunks), unsafe_allow_html=True)
+                    html_chunks = []
                 reply_attachment = reply['attachment_url']
                 st.markdown("📎 **Attachment:**")
                 
-                # Extract filename
-                try:
-                    # Remove query parameters first (everything after '?')
-                    url_without_params = reply_attachment.split('?')[0]
-                    
-                    # Extract the path part after the last '/'
-                    path_part = url_without_params.split('/')[-1]
-                    
-                    # Handle timestamp format like "api_2025-09-04T14:30:50.602985+00:00_test.txt"
-                    if '_' in path_part and len(path_part.split('_')) >= 3:
-                        parts = path_part.split('_')
-                        # Look for parts that contain file extensions
-                        for i, part in enumerate(parts):
-                            if '.' in part and any(ext in part.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.svg', '.pdf', '.txt', '.doc', '.xlsx']):
-                                reply_file_name = '_'.join(parts[i:])
-                                break
-                        else:
-                            reply_file_name = parts[-1] if parts else "attachment"
-                    else:
-                        reply_file_name = path_part
-                    
-                    # Clean up URL encoding
-                    reply_file_name = reply_file_name.replace('%20', ' ').replace('%2B', '+')
-                except:
-                    reply_file_name = "attachment"
+                reply_file_name, is_image = _attachment_info(reply_attachment)
                 
-                if any(ext in reply_attachment.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.svg']):
+                if is_image:
                     try:
                         col1, col2 = st.columns([2, 1])
                         with col1:
                             st.image(reply_attachment, caption=f"📷 {reply_file_name}", width=250)
                         with col2:
                             st.markdown(f"[🔗 View Full Size]({reply_attachment})")
-                    except:
+                    except Exception:
                         st.markdown(f"📎 [📥 Download {reply_file_name}]({reply_attachment})")
                 else:
                     st.markdown(f"📎 [📥 Download {reply_file_name}]({reply_attachment})")
             
             if i < len(sorted_replies) - 1:  # Add separator except for last message
-                st.markdown("<br>", unsafe_allow_html=True)
+                html_chunks.append("<br>")
+        
+        if html_chunks:
+            st.markdown("".join(html_chunks), unsafe_allow_html=True)
     else:
         st.info("💭 No conversation messages yet. Be the first to add a reply!")
     
@@ -569,7 +858,7 @@ def show_ticket_details(ticket):
                 st.info(f"📎 **Ready to upload:**")
             with col2:
                 st.write(f"**File:** {uploaded_file.name}")
-                st.write(f"**Size:** {len(uploaded_file.getvalue())} bytes")
+                st.write(f"**Size:** {uploaded_file.size} bytes")
                 if uploaded_file.type.startswith('image/'):
                     st.image(uploaded_file, caption="Preview", width=200)
         
@@ -581,7 +870,7 @@ def show_ticket_details(ticket):
                     attachment_url = None
                     if uploaded_file:
                         with st.spinner("📤 Uploading file..."):
-                            attachment_url = upload_file_via_api(uploaded_file.getvalue(), uploaded_file.name, ticket['id'])
+                            attachment_url = upload_file_via_api(uploaded_file, uploaded_file.name, ticket['id'])
                             if attachment_url:
                                 st.success(f"📎 File '{uploaded_file.name}' uploaded successfully!")
                             else:
@@ -603,14 +892,17 @@ def show_ticket_details(ticket):
                             st.success("✅ Reply with attachment sent successfully!")
                         else:
                             st.success("✅ Reply sent successfully!")
-                        st.rerun()
+                        _mark_ticket_updated(ticket['id'])
+                        st.rerun(scope="fragment")
                     else:
                         st.error("❌ Failed to send reply. Please try again.")
                 else:
                     st.warning("⚠️ Please enter a reply or attach a file before sending.")
         with col2:
             if st.form_submit_button("🔄 Refresh", use_container_width=True):
-                st.rerun()
+                _invalidate_ticket_cache()
+                _mark_ticket_updated(ticket['id'])
+                st.rerun(scope="fragment")
 
 def admin_panel():
     st.title("👨‍💼 Admin Panel")
@@ -641,9 +933,10 @@ def admin_panel():
     
     # Admin statistics
     col1, col2, col3, col4 = st.columns(4)
-    open_tickets = len([t for t in tickets if t['status'] == 'Open'])
-    in_progress = len([t for t in tickets if t['status'] == 'In Progress'])
-    closed_tickets = len([t for t in tickets if t['status'] == 'Closed'])
+    counts = Counter(t['status'] for t in tickets)
+    open_tickets = counts.get('Open', 0)
+    in_progress = counts.get('In Progress', 0)
+    closed_tickets = counts.get('Closed', 0)
     
     with col1:
         st.metric("Total Tickets", len(tickets))
@@ -657,150 +950,140 @@ def admin_panel():
     # Ticket management
     st.subheader("🎫 Manage Tickets")
     
-    for ticket in sorted(tickets, key=lambda x: x.get('created_at', ''), reverse=True):
-        with st.expander(f"🎫 #{ticket['id']} - {ticket['title']} ({ticket['status']})", expanded=False):
-            col1, col2 = st.columns([3, 1])
+    # All conversations are resolved up front rather than one request per expander
+    replies_by_ticket = get_replies_for_tickets(tickets)
+    for ticket in sorted(tickets, key=_created_at_key, reverse=True):
+        _render_admin_ticket(ticket, replies_by_ticket[ticket['id']])
+
+# One ticket's admin view as a fragment - typing, replying or generating an
+# AI reply reruns only this ticket instead of every ticket on the page
+@st.fragment
+def _render_admin_ticket(ticket, replies):
+    replies = _fragment_replies(ticket, replies)
+    with st.expander(f"🎫 #{ticket['id']} - {ticket['title']} ({ticket['status']})", expanded=False):
+        col1, col2 = st.columns([3, 1])
+        
+        with col1:
+            st.write(f"**Description:** {ticket['description']}")
+            st.write(f"**Created by:** {ticket.get('created_by', 'Unknown')}")
+            st.write(f"**Category:** {ticket['category']}")
             
-            with col1:
-                st.write(f"**Description:** {ticket['description']}")
-                st.write(f"**Created by:** {ticket.get('created_by', 'Unknown')}")
-                st.write(f"**Category:** {ticket['category']}")
-                
-                # Show conversation
-                replies = get_ticket_replies(ticket['id'])
-                if replies:
-                    st.write("**Conversation:**")
-                    for reply in replies:
-                        # Handle different field name possibilities  
-                        role = reply.get('role') or reply.get('reply_type', 'user')
-                        text = reply.get('text') or reply.get('content', '')
-                        
-                        if role == 'user':
-                            st.markdown(f'<div class="chat-message user-message">👤 <strong>User:</strong> {text}</div>', unsafe_allow_html=True)
-                        elif role == 'ai':
-                            st.markdown(f'<div class="chat-message assistant-message">🤖 <strong>AI:</strong> {text}</div>', unsafe_allow_html=True)
-                        elif role == 'admin':
-                            st.markdown(f'<div class="chat-message admin-message">👨‍💼 <strong>Admin:</strong> {text}</div>', unsafe_allow_html=True)
+            # Show conversation
+            if replies:
+                st.write("**Conversation:**")
+                html_chunks = []
+                for reply in replies:
+                    # Handle different field name possibilities  
+                    role = reply.get('role') or reply.get('reply_type', 'user')
+                    text = reply.get('text') or reply.get('content', '')
+                    
+                    cls, icon, label = ROLE_TEMPLATES.get(role, ROLE_TEMPLATES['user'])
+                    html_chunks.append(_ADMIN_MSG_TMPL.format_map({
+                        'cls': cls, 'icon': icon, 'label': label, 'text': html.escape(text or '')
+                    }))
+                    
+                    # Show attachments in admin panel conversation too - as plain HTML
+                    # so the browser lazy-loads and caches images and the batch stays whole
+                    if reply.get('attachment_url'):
+                        file_name, is_image = _attachment_info(reply['attachment_url'])
+                        attachment = {'url': html.escape(reply['attachment_url']), 'name': html.escape(file_name)}
                         
-                        # Show attachments in admin panel conversation too
-                        if reply.get('attachment_url'):
-                            attachment_url = reply['attachment_url']
-                            try:
-                                # Remove query parameters first (everything after '?')
-                                url_without_params = attachment_url.split('?')[0]
-                                
-                                # Extract the path part after the last '/'
-                                path_part = url_without_params.split('/')[-1]
-                                
-                                # Handle timestamp format like "api_2025-09-04T14:30:50.602985+00:00_test.txt"
-                                if '_' in path_part and len(path_part.split('_')) >= 3:
-                                    parts = path_part.split('_')
-                                    # Look for parts that contain file extensions
-                                    for i, part in enumerate(parts):
-                                        if '.' in part and any(ext in part.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.svg', '.pdf', '.txt', '.doc', '.xlsx']):
-                                            file_name = '_'.join(parts[i:])
-                                            break
-                                    else:
-                                        file_name = parts[-1] if parts else "attachment"
-                                else:
-                                    file_name = path_part
-                                
-                                # Clean up URL encoding
-                                file_name = file_name.replace('%20', ' ').replace('%2B', '+')
-                            except:
-                                file_name = "attachment"
-                            
-                            if any(ext in attachment_url.lower() for ext in ['.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp']):
-                                try:
-                                    st.image(attachment_url, caption=f"📷 {file_name}", width=200)
-                                except:
-                                    st.markdown(f"📎 [📥 {file_name}]({attachment_url})")
-                            else:
-                                st.markdown(f"📎 [📥 {file_name}]({attachment_url})")
-            
-            with col2:
-                # Status update
-                new_status = st.selectbox("Status", ["Open", "In Progress", "Closed"], 
-                                        index=["Open", "In Progress", "Closed"].index(ticket['status']),
-                                        key=f"status_{ticket['id']}")
+                        if is_image:
+                            html_chunks.append(_IMAGE_TMPL.format_map(attachment))
+                        else:
+                            html_chunks.append(_FILE_LINK_TMPL.format_map(attachment))
                 
-                if st.button("Update Status", key=f"update_{ticket['id']}"):
-                    if update_ticket_status(ticket['id'], new_status):
-                        st.success("Status updated!")
-                        st.rerun()
+                if html_chunks:
+                    st.markdown("".join(html_chunks), unsafe_allow_html=True)
+        
+        with col2:
+            # Status update
+            new_status = st.selectbox("Status", _STATUSES,
+                                    index=_STATUS_IDX.get(ticket['status'], 0),
+                                    key=f"status_{ticket['id']}")
+            
+            if st.button("Update Status", key=f"update_{ticket['id']}"):
+                if update_ticket_status(ticket['id'], new_status):
+                    st.success("Status updated!")
+                    st.rerun()
+            
+            # Admin reply with file upload
+            st.write("**💬 Admin Actions:**")
+            st.info("🤖 **AI Reply Feature**: The 'Generate AI Reply' button uses artificial intelligence to automatically analyze the ticket content, conversation history, and context to provide an intelligent, helpful response. The AI will automatically post the reply to the conversation.")
+            
+            with st.form(f"admin_reply_{ticket['id']}"):
+                admin_reply = st.text_area("Admin Reply:", key=f"admin_reply_{ticket['id']}")
+                admin_file = st.file_uploader("📎 Attach File (Optional)", key=f"admin_file_{ticket['id']}")
                 
-                # Admin reply with file upload
-                st.write("**💬 Admin Actions:**")
-                st.info("🤖 **AI Reply Feature**: The 'Generate AI Reply' button uses artificial intelligence to automatically analyze the ticket content, conversation history, and context to provide an intelligent, helpful response. The AI will automatically post the reply to the conversation.")
+                # Show admin file preview if uploaded
+                if admin_file:
+                    col1, col2 = st.columns([1, 3])
+                    with col1:
+                        st.info(f"📎 **Admin attachment:**")
+                    with col2:
+                        st.write(f"**File:** {admin_file.name}")
+                        st.write(f"**Size:** {admin_file.size} bytes")
+                        if admin_file.type.startswith('image/'):
+                            st.image(admin_file, caption="Preview", width=200)
                 
-                with st.form(f"admin_reply_{ticket['id']}"):
-                    admin_reply = st.text_area("Admin Reply:", key=f"admin_reply_{ticket['id']}")
-                    admin_file = st.file_uploader("📎 Attach File (Optional)", key=f"admin_file_{ticket['id']}")
-                    
-                    # Show admin file preview if uploaded
-                    if admin_file:
-                        col1, col2 = st.columns([1, 3])
-                        with col1:
-                            st.info(f"📎 **Admin attachment:**")
-                        with col2:
-                            st.write(f"**File:** {admin_file.name}")
-                            st.write(f"**Size:** {len(admin_file.getvalue())} bytes")
-                            if admin_file.type.startswith('image/'):
-                                st.image(admin_file, caption="Preview", width=200)
-                    
-                    col_reply1, col_reply2 = st.columns(2)
-                    with col_reply1:
-                        if st.form_submit_button("Send Reply"):
-                            if admin_reply or admin_file:
-                                # Upload file first if provided
-                                attachment_url = None
-                                if admin_file:
-                                    attachment_url = upload_file_via_api(admin_file.getvalue(), admin_file.name, ticket['id'])
-                                    if attachment_url:
-                                        st.info(f"📎 File '{admin_file.name}' uploaded!")
-                                
-                                # Send reply with attachment URL if available
-                                reply_text = admin_reply if admin_reply else f"📎 Shared a file: {admin_file.name if admin_file else 'attachment'}"
-                                reply_data = {
-                                    "text": reply_text,
-                                    "role": "admin"
-                                }
-                                
-                                # Add attachment URL to reply if file was uploaded
+                col_reply1, col_reply2 = st.columns(2)
+                with col_reply1:
+                    if st.form_submit_button("Send Reply"):
+                        if admin_reply or admin_file:
+                            # Upload file first if provided
+                            attachment_url = None
+                            if admin_file:
+                                attachment_url = upload_file_via_api(admin_file, admin_file.name, ticket['id'])
                                 if attachment_url:
-                                    reply_data["attachment_url"] = attachment_url
-                                
-                                if add_reply_via_api(ticket['id'], reply_data):
-                                    if attachment_url:
-                                        st.success("✅ Admin reply with attachment sent!")
-                                    else:
-                                        st.success("✅ Admin reply sent!")
-                                    st.rerun()
-                            else:
-                                st.warning("Please enter a reply or attach a file")
-                    
-                    with col_reply2:
-                        if st.form_submit_button("🤖 Generate AI Reply"):
-                            # Show what the AI reply feature does
-                            with st.spinner("🤖 AI is analyzing the ticket and generating an intelligent response..."):
-                                # Get all conversation history for better context
-                                conversation_context = f"Ticket: {ticket['title']}\nDescription: {ticket['description']}\n\n"
-                                replies = get_ticket_replies(ticket['id'])
-                                if replies:
-                                    conversation_context += "Previous conversation:\n"
-                                    for reply in replies:
-                                        role = reply.get('role', 'user')
-                                        text = reply.get('text', '')
-                                        conversation_context += f"{role.title()}: {text}\n"
-                                
-                                # Generate AI reply with full context
-                                ai_response = generate_ai_reply(ticket['id'], f"As a helpful customer service AI, provide a professional and helpful response to this ticket based on the conversation context:\n\n{conversation_context}")
-                                if ai_response:
-                                    st.success("🤖 AI reply automatically generated and added to the conversation!")
-                                    st.info("💡 The AI analyzed the ticket content and conversation history to provide an intelligent, contextual response.")
-                                    st.rerun()
+                                    st.info(f"📎 File '{admin_file.name}' uploaded!")
+                            
+                            # Send reply with attachment URL if available
+                            reply_text = admin_reply if admin_reply else f"📎 Shared a file: {admin_file.name if admin_file else 'attachment'}"
+                            reply_data = {
+                                "text": reply_text,
+                                "role": "admin"
+                            }
+                            
+                            # Add attachment URL to reply if file was uploaded
+                            if attachment_url:
+                                reply_data["attachment_url"] = attachment_url
+                            
+                            if add_reply_via_api(ticket['id'], reply_data):
+                                if attachment_url:
+                                    st.success("✅ Admin reply with attachment sent!")
                                 else:
-                                    st.error("Failed to generate AI reply. Please try again.")
+                                    st.success("✅ Admin reply sent!")
+                                _mark_ticket_updated(ticket['id'])
+                                st.rerun(scope="fragment")
+                        else:
+                            st.warning("Please enter a reply or attach a file")
+                
+                with col_reply2:
+                    if st.form_submit_button("🤖 Generate AI Reply"):
+                        # Show what the AI reply feature does
+                        with st.spinner("🤖 AI is analyzing the ticket and generating an intelligent response..."):
+                            # Get all conversation history for better context - reuse the
+                            # replies already resolved for this page instead of refetching
+                            context_parts = [f"Ticket: {ticket['title']}\nDescription: {ticket['description']}\n\n"]
+                            if replies:
+                                context_parts.append("Previous conversation:\n")
+                                context_parts.extend(f"{reply.get('role', 'user').title()}: {reply.get('text', '')}\n" for reply in replies)
+                            conversation_context = "".join(context_parts)
+                            
+                            # Generate AI reply with full context
+                            prompt = f"As a helpful customer service AI, provide a professional and helpful response to this ticket based on the conversation context:\n\n{conversation_context}"
+                            ctx_hash = hashlib.blake2b(conversation_context.encode(), digest_size=16).hexdigest()
+                            try:
+                                ai_response = _cached_ai_reply(ticket['id'], ctx_hash, prompt)
+                            except RuntimeError:
+                                ai_response = None
+                            if ai_response:
+                                st.success("🤖 AI reply automatically generated and added to the conversation!")
+                                st.info("💡 The AI analyzed the ticket content and conversation history to provide an intelligent, contextual response.")
+                                _mark_ticket_updated(ticket['id'])
+                                st.rerun(scope="fragment")
+                            else:
+                                st.error("Failed to generate AI reply. Please try again.")
 
 if __name__ == "__main__":
     main()